@@ -1,8 +1,11 @@
 import yfinance as yf
 import pandas as pd
-import json
+import orjson
 import os
 import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- CONFIGURACIÓN ---
 # Carpeta donde se guardarán los datos brutos descargados
@@ -11,6 +14,23 @@ RAW_DATA_DIR = 'data/raw'
 # Tickers de ejemplo. En un proyecto real, cargarías los 500 tickers desde un archivo.
 TICKERS_EJEMPLO = ['MSFT', 'ORCL', 'CRM', 'CSCO', 'ADBE', 'NOW', 'AKAM', 'VRSN', 'CDNS', 'JPM', 'BAC', 'WFC', 'V', 'MA', 'BLK', 'GS', 'SPGI', 'MCO', 'C', 'JNJ', 'UNH', 'LLY', 'MRK', 'ABBV', 'PFE', 'TMO', 'ABT', 'DHR', 'GILD', 'PG', 'KO', 'PEP', 'WMT', 'COST', 'MDLZ', 'CL', 'KHC', 'GIS', 'CHD']
 
+# Política de acceso a Yahoo (DEBE COINCIDIR en data_loader.py y prices.py):
+# como máximo MAX_WORKERS descargas simultáneas y TICKERS_PER_MINUTE tickers por minuto
+MAX_WORKERS = 8
+TICKERS_PER_MINUTE = 60
+
+# Vigencia de la caché en disco (segundos): si los JSON son más recientes, no se vuelven a descargar
+INFO_TTL = 7 * 24 * 3600
+FINANCIALS_TTL = 7 * 24 * 3600
+
+# Tamaño del búfer de escritura: cada archivo se vuelca en una sola llamada a write()
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Estado del límite de ritmo compartido entre hilos (cubo de tokens)
+_rate_lock = threading.Lock()
+_rate_tokens = float(TICKERS_PER_MINUTE)
+_rate_last_refill = time.monotonic()
+
 # --- FUNCIONES CORE ---
 
 def setup_directories():
@@ -19,12 +39,60 @@ def setup_directories():
         os.makedirs(RAW_DATA_DIR)
         print(f"Directorio creado: {RAW_DATA_DIR}")
 
-def download_and_save_data(ticker):
+def is_fresh(path, ttl):
+    """Indica si el archivo existe y fue modificado hace menos de 'ttl' segundos."""
+    try:
+        return time.time() - os.stat(path).st_mtime < ttl
+    except FileNotFoundError:
+        return False
+
+def acquire_rate_limit(units=1):
+    """
+    Bloquea hasta disponer de 'units' unidades del límite de ritmo (cubo de tokens con capacidad
+    y recarga de TICKERS_PER_MINUTE por minuto). Cada ticker cuenta como una unidad.
+    """
+    global _rate_tokens, _rate_last_refill
+    while True:
+        with _rate_lock:
+            now = time.monotonic()
+            _rate_tokens = min(TICKERS_PER_MINUTE, _rate_tokens + (now - _rate_last_refill) * TICKERS_PER_MINUTE / 60)
+            _rate_last_refill = now
+            if _rate_tokens >= units:
+                _rate_tokens -= units
+                return
+            wait = (units - _rate_tokens) * 60 / TICKERS_PER_MINUTE
+        time.sleep(wait)
+
+def dataframe_to_json(df):
+    """
+    Serializa un estado financiero de yFinance (filas = conceptos, columnas = fechas)
+    a JSON con el mismo esquema que 'to_json(orient="columns")': {timestamp_ms: {concepto: valor}}.
+    """
+    data = {str(date.value // 10**6): column.to_dict() for date, column in df.items()}
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC)
+
+def download_and_save_data(ticker, force=False):
     """
     Descarga la información financiera clave de un solo ticker y la guarda
     en múltiples archivos JSON dentro de la carpeta RAW_DATA_DIR.
+    Si los archivos ya existen y siguen vigentes se omite la descarga, salvo con 'force'.
     """
     print(f"\n--- Procesando {ticker} ---")
+
+    # 0. Comprobar la caché en disco antes de llamar a la API
+    cached_files = {
+        os.path.join(RAW_DATA_DIR, f'{ticker}_info.json'): INFO_TTL,
+        os.path.join(RAW_DATA_DIR, f'{ticker}_financials.json'): FINANCIALS_TTL,
+        os.path.join(RAW_DATA_DIR, f'{ticker}_balance_sheet.json'): FINANCIALS_TTL,
+        os.path.join(RAW_DATA_DIR, f'{ticker}_cashflow.json'): FINANCIALS_TTL,
+    }
+    if not force and all(is_fresh(path, ttl) for path, ttl in cached_files.items()):
+        print(f"Datos de {ticker} ya disponibles en caché. Se omite la descarga.")
+        return True
+
+    # Respetar el límite de ritmo de la API (un ticker = una unidad, sean cuantas sean sus peticiones)
+    acquire_rate_limit()
+
     try:
         # 1. Inicializar el objeto Ticker
         stock = yf.Ticker(ticker)
@@ -36,23 +104,23 @@ def download_and_save_data(ticker):
             return False
         
         # 3. Guardar la información general
-        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_info.json'), 'w') as f:
-            json.dump(info, f, indent=4)
+        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_info.json'), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(orjson.dumps(info))
 
         # 4. Obtener Estados Financieros (últimos 4 años)
-        financials = stock.financials.to_json(orient='columns', indent=4)
-        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_financials.json'), 'w') as f:
-            f.write(financials)
+        financials = stock.financials
+        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_financials.json'), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(dataframe_to_json(financials))
 
         # 5. Obtener Balance General (últimos 4 años)
-        balance_sheet = stock.balance_sheet.to_json(orient='columns', indent=4)
-        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_balance_sheet.json'), 'w') as f:
-            f.write(balance_sheet)
+        balance_sheet = stock.balance_sheet
+        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_balance_sheet.json'), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(dataframe_to_json(balance_sheet))
         
         # 6. Obtener Flujos de Caja (últimos 4 años)
-        cashflow = stock.cashflow.to_json(orient='columns', indent=4)
-        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_cashflow.json'), 'w') as f:
-            f.write(cashflow)
+        cashflow = stock.cashflow
+        with open(os.path.join(RAW_DATA_DIR, f'{ticker}_cashflow.json'), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(dataframe_to_json(cashflow))
 
         print(f"Datos de {ticker} descargados y guardados con éxito.")
         return True
@@ -61,19 +129,19 @@ def download_and_save_data(ticker):
         print(f"ERROR: Falló la descarga de datos para {ticker}. Razón: {e}")
         return False
 
-def run_data_pipeline(tickers_list):
-    """Orquesta el proceso de descarga de datos para toda la lista de tickers."""
+def run_data_pipeline(tickers_list, force=False):
+    """
+    Orquesta el proceso de descarga de datos para toda la lista de tickers.
+    Con 'force=True' se ignora la caché y se descarga todo de nuevo.
+    """
     setup_directories()
     
     print(f"Iniciando descarga para {len(tickers_list)} tickers.")
-    downloaded_count = 0
 
-    for ticker in tickers_list:
-        if download_and_save_data(ticker):
-            downloaded_count += 1
-        
-        # Pausa para evitar ser bloqueado por la API (Buenas prácticas)
-        time.sleep(1) 
+    # Descargar los tickers en paralelo (operación limitada por red)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(download_and_save_data, ticker, force): ticker for ticker in tickers_list}
+        downloaded_count = sum(future.result() for future in as_completed(futures))
 
     print("\n--- RESUMEN DE LA DESCARGA ---")
     print(f"Total de tickers procesados: {len(tickers_list)}")
@@ -84,5 +152,8 @@ if __name__ == '__main__':
     # En un proyecto real, cargarías una lista grande.
     # Por ejemplo, leyendo desde un JSON o CSV que contenga los 500 tickers.
     # Ejemplo: tickers = pd.read_csv('config/sp500_tickers.csv')['Symbol'].tolist()
-    
-    run_data_pipeline(TICKERS_EJEMPLO)
+    parser = argparse.ArgumentParser(description="Descarga los datos financieros brutos de Yahoo Finance.")
+    parser.add_argument('--force', action='store_true', help="Ignora la caché en disco y descarga todos los datos de nuevo.")
+    args = parser.parse_args()
+
+    run_data_pipeline(TICKERS_EJEMPLO, force=args.force)
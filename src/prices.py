@@ -1,8 +1,12 @@
 import yfinance as yf
 import pandas as pd
-import json
+import orjson
 import os
 import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from datetime import datetime
 
 # --- CONFIGURACIÓN DE RUTAS (Basada en ratio_calculator.py) ---
@@ -14,19 +18,39 @@ FILE_PATTERN = '{ticker}_{type}.json'
 TICKERS_TO_ANALYZE = ['MSFT', 'ORCL', 'CRM', 'CSCO', 'ADBE', 'NOW', 'AKAM', 'VRSN', 'CDNS', 'ANSS', 'JPM', 'BAC', 'WFC', 'V', 'MA', 'BLK', 'GS', 'SPGI', 'MCO', 'C', 'JNJ', 'UNH', 'LLY', 'MRK', 'ABBV', 'PFE', 'TMO', 'ABT', 'DHR', 'GILD', 'PG', 'KO', 'PEP', 'WMT', 'COST', 'MDLZ', 'CL', 'KHC', 'GIS', 'CHD']
 # Carpeta de salida para los datos procesados (donde se guardan los ratios)
 OUTPUT_BASE_DIR = 'data/processed'
+# Política de acceso a Yahoo (DEBE COINCIDIR en data_loader.py y prices.py):
+# como máximo MAX_WORKERS descargas simultáneas y TICKERS_PER_MINUTE tickers por minuto
+MAX_WORKERS = 8
+TICKERS_PER_MINUTE = 60
+
+# Vigencia de la caché en disco (segundos): los precios se consideran válidos durante 24 horas
+PRICES_TTL = 24 * 3600
+
+# Tamaño del búfer de escritura de los archivos de salida
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Carpetas ya creadas durante la ejecución
+_CREATED_DIRS = set()
+
+# Estado del límite de ritmo compartido entre hilos (cubo de tokens)
+_rate_lock = threading.Lock()
+_rate_tokens = float(TICKERS_PER_MINUTE)
+_rate_last_refill = time.monotonic()
 
 # --- FUNCIONES CORE ---
 
+@lru_cache(maxsize=None)
 def get_industry_key(ticker):
     """
     Lee el archivo 'info.json' para obtener la IndustryKey (sector) de un ticker.
     Esto garantiza que los precios se guarden en la misma carpeta que los ratios.
+    El resultado se memoriza, por lo que cada archivo se lee una sola vez por ejecución.
     """
     # Construir la ruta al archivo info.json usando el patrón de archivo
     info_path = os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type='info'))
     try:
-        with open(info_path, 'r') as f:
-            info_data = json.load(f)
+        with open(info_path, 'rb') as f:
+            info_data = orjson.loads(f.read())
             # Intentar obtener 'industryKey', si no, usar 'sector', si no, 'default_industry'
             return info_data.get('industryKey') or info_data.get('sector') or 'default_industry'
     except FileNotFoundError:
@@ -36,64 +60,135 @@ def get_industry_key(ticker):
         print(f"Error al leer el archivo INFO de {ticker}: {e}. Usando 'default_industry'.")
         return 'default_industry'
 
-def download_and_save_prices(ticker):
+def ensure_dir(path):
+    """Crea la carpeta si no existe, recordando las ya creadas para no repetir la llamada al sistema."""
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
+def acquire_rate_limit(units=1):
     """
-    Descarga los precios históricos (últimos 5 años) y los guarda en un CSV
-    dentro de la subcarpeta de su industria dentro de OUTPUT_BASE_DIR.
+    Bloquea hasta disponer de 'units' unidades del límite de ritmo (cubo de tokens con capacidad
+    y recarga de TICKERS_PER_MINUTE por minuto). Cada ticker cuenta como una unidad.
+    """
+    global _rate_tokens, _rate_last_refill
+    while True:
+        with _rate_lock:
+            now = time.monotonic()
+            _rate_tokens = min(TICKERS_PER_MINUTE, _rate_tokens + (now - _rate_last_refill) * TICKERS_PER_MINUTE / 60)
+            _rate_last_refill = now
+            if _rate_tokens >= units:
+                _rate_tokens -= units
+                return
+            wait = (units - _rate_tokens) * 60 / TICKERS_PER_MINUTE
+        time.sleep(wait)
+
+def is_fresh(path, ttl):
+    """Indica si el archivo existe y fue modificado hace menos de 'ttl' segundos."""
+    try:
+        return time.time() - os.stat(path).st_mtime < ttl
+    except FileNotFoundError:
+        return False
+
+def get_prices_output_path(ticker):
+    """
+    Devuelve la ruta del archivo de precios de un ticker dentro de la subcarpeta
+    de su industria (data/processed/{sector}/), creando la carpeta si no existe.
     """
-    
     # 1. Obtener la IndustryKey (Sector)
     industry = get_industry_key(ticker)
     
     # 2. Definir la ruta de salida
-    # La ruta de salida incluye la subcarpeta del sector: data/processed/{sector}/
     industry_output_dir = os.path.join(OUTPUT_BASE_DIR, industry)
-    os.makedirs(industry_output_dir, exist_ok=True)
+    ensure_dir(industry_output_dir)
     
-    file_name = f"{ticker}_historical_prices.csv"
-    output_path = os.path.join(industry_output_dir, file_name)
+    file_name = f"{ticker}_historical_prices.parquet"
+    return os.path.join(industry_output_dir, file_name)
+
+def save_prices(ticker, all_prices):
+    """
+    Extrae los precios de un ticker del DataFrame descargado en bloque (columnas agrupadas
+    por ticker) y los guarda en un Parquet dentro de la subcarpeta de su industria.
+    """
+    output_path = get_prices_output_path(ticker)
     
-    print(f"\n--- Descargando precios de {ticker} (Industria: {industry}) ---")
+    print(f"\n--- Guardando precios de {ticker} (Industria: {get_industry_key(ticker)}) ---")
 
     try:
-        # Descargar los precios: 5 años de datos con intervalo semanal para mantener el tamaño razonable
-        # Sí, la función correcta es yf.download()
-        data = yf.download(ticker, period='5y', interval='1wk', progress=False) 
+        if ticker not in all_prices.columns.get_level_values(0):
+            print(f"Advertencia: No se encontraron datos de precios para {ticker}.")
+            return False
+
+        # Guardar solo las columnas relevantes
+        data = all_prices[ticker][['Close', 'Volume']].dropna()
 
         if data.empty:
             print(f"Advertencia: No se encontraron datos de precios para {ticker}.")
             return False
 
-        # Guardar solo las columnas relevantes
-        data[['Close', 'Volume']].to_csv(output_path)
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            data.to_parquet(f, engine='pyarrow', compression='snappy')
         print(f"Éxito: Precios históricos de {ticker} guardados en: {output_path}")
         return True
 
     except Exception as e:
-        print(f"ERROR: Falló la descarga de precios para {ticker}. Razón: {e}")
+        print(f"ERROR: Falló el guardado de precios para {ticker}. Razón: {e}")
         return False
 
-def run_price_download_pipeline(tickers_list=TICKERS_TO_ANALYZE):
-    """Orquesta el proceso de descarga de datos de precios para toda la lista de tickers."""
+def run_price_download_pipeline(tickers_list=TICKERS_TO_ANALYZE, force=False):
+    """
+    Orquesta el proceso de descarga de datos de precios para toda la lista de tickers.
+    Los archivos vigentes en caché se omiten, salvo con 'force=True'.
+    """
     
     # Crear la carpeta de salida principal si no existe
-    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    ensure_dir(OUTPUT_BASE_DIR)
     
     print("Iniciando la descarga de precios históricos...")
-    
-    downloaded_count = 0
+
+    # Precargar las IndustryKey en un solo hilo antes de guardar en paralelo
+    for ticker in tickers_list:
+        get_industry_key(ticker)
+
+    # 1. Omitir los tickers cuyos precios siguen vigentes en caché
+    cached_count = 0
+    pending_tickers = []
     for ticker in tickers_list:
-        if download_and_save_prices(ticker):
-            downloaded_count += 1
-        
-        # Pausa breve para buenas prácticas
-        time.sleep(0.5) 
+        output_path = get_prices_output_path(ticker)
+        if not force and is_fresh(output_path, PRICES_TTL):
+            print(f"Precios de {ticker} ya disponibles en caché: {output_path}")
+            cached_count += 1
+        else:
+            pending_tickers.append(ticker)
+
+    downloaded_count = 0
+    for start in range(0, len(pending_tickers), TICKERS_PER_MINUTE):
+        batch = pending_tickers[start:start + TICKERS_PER_MINUTE]
+
+        # 2. Descargar los precios del bloque en una sola llamada: 5 años con intervalo semanal
+        # para mantener el tamaño razonable (yfinance reparte las peticiones en MAX_WORKERS hilos)
+        acquire_rate_limit(len(batch))
+        try:
+            all_prices = yf.download(
+                batch, period='5y', interval='1wk', group_by='ticker', threads=MAX_WORKERS, progress=False
+            )
+        except Exception as e:
+            print(f"ERROR: Falló la descarga de precios. Razón: {e}")
+            all_prices = pd.DataFrame()
+
+        # 3. Guardar los precios de cada ticker en paralelo
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(save_prices, ticker, all_prices): ticker for ticker in batch}
+            downloaded_count += sum(future.result() for future in as_completed(futures))
             
     print("\n--- RESUMEN DE LA DESCARGA DE PRECIOS ---")
     print(f"Total de tickers procesados: {len(tickers_list)}")
-    print(f"Archivos de precios guardados: {downloaded_count}")
+    print(f"Archivos de precios guardados: {downloaded_count + cached_count}")
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Descarga los precios históricos de Yahoo Finance.")
+    parser.add_argument('--force', action='store_true', help="Ignora la caché en disco y descarga todos los precios de nuevo.")
+    args = parser.parse_args()
 
-# Se asume que este es el script principal que deseas ejecutar.
-run_price_download_pipeline()
\ No newline at end of file
+    run_price_download_pipeline(force=args.force)
\ No newline at end of file
@@ -1,6 +1,8 @@
 import pandas as pd
-import json
+import numpy as np
+import orjson
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # --- 1. CONFIGURACIÓN DE ARCHIVOS Y RUTAS ---
@@ -10,42 +12,115 @@ INPUT_DIR = 'data/raw'
 FILE_PATTERN = '{ticker}_{type}.json'
 # LISTA DE EMPRESAS A ANALIZAR. Si faltan archivos, el script mostrará una advertencia para ese ticker.
 TICKERS_TO_ANALYZE = ['MSFT', 'ORCL', 'CRM', 'CSCO', 'ADBE', 'NOW', 'AKAM', 'VRSN', 'CDNS']
+# Carpeta de salida para los datos procesados
+OUTPUT_BASE_DIR = 'data/processed'
 
 # Columnas necesarias de cada archivo para los cálculos
 FINANCIALS_COLS = ['Net Income', 'EBIT', 'EBITDA', 'Tax Provision', 'Pretax Income', 'Diluted EPS']
 BALANCE_SHEET_COLS = ['Stockholders Equity', 'Invested Capital', 'Total Debt', 'Cash And Cash Equivalents']
 CASHFLOW_COLS = ['Free Cash Flow']
+# Columnas que deben tener valor en un período para poder calcular sus ratios
+REQUIRED_COLS = ['Net Income', 'Stockholders Equity', 'EBIT', 'EBITDA', 'Free Cash Flow']
+# Columnas de ratios que se muestran con dos decimales ('N/A' si el divisor era cero)
+NUM_COLS = ['ROE (%)', 'ROIC (%)', 'PER (Price/EPS)', 'EV/EBIT', 'EV/EBITDA', 'EV/FCF']
+# Columnas (y su orden) de la tabla que se muestra por pantalla
+DISPLAY_COLS = ['Date (Últ. Reporte)'] + NUM_COLS + ['Market Cap', 'EV']
+
+# Tipos de archivo JSON que se leen por cada ticker
+RAW_FILE_TYPES = ['financials', 'balance_sheet', 'cashflow', 'info']
+# Hilos usados para leer los archivos del disco en paralelo
+IO_WORKERS = 16
+# Hilos usados para escribir los archivos por industria en paralelo
+FILE_WRITERS = 4
+
+# Tamaño del búfer de escritura de los archivos de salida
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Carpetas ya creadas durante la ejecución
+_CREATED_DIRS = set()
 
 # --- 2. Funciones de Carga y Limpieza de Datos (Adaptadas para un ticker específico) ---
-def load_and_clean_financial_data(file_path, keep_columns):
+def read_raw_file(file_path):
     """
-    Carga un archivo JSON de yFinance (balance, financials, cashflow), lo convierte a DataFrame,
-    limpia y usa los timestamps como índice.
+    Lee el contenido bruto (bytes) de un archivo del sistema de archivos local.
+    Devuelve None si el archivo no existe.
     """
     try:
-        # Aquí se simula la carga desde el sistema de archivos local
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            return f.read()
     except FileNotFoundError:
-        # Esto es normal si se usa un patrón. Simplemente devuelve un DataFrame vacío.
-        return pd.DataFrame() 
+        # Esto es normal si se usa un patrón.
+        return None
+
+def prefetch_raw_files(tickers):
+    """
+    Lee en paralelo todos los archivos JSON de la lista de tickers para mantener el disco ocupado.
+    Devuelve un diccionario {ticker: {tipo: bytes o None}}.
+    """
+    keys = [(ticker, file_type) for ticker in tickers for file_type in RAW_FILE_TYPES]
+    paths = [os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type=file_type)) for ticker, file_type in keys]
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as executor:
+        contents = executor.map(read_raw_file, paths)
+
+    raw_files = {ticker: {} for ticker in tickers}
+    for (ticker, file_type), content in zip(keys, contents):
+        raw_files[ticker][file_type] = content
+    return raw_files
+
+def load_and_clean_financial_data(raw_content, keep_columns):
+    """
+    Carga el contenido de un archivo JSON de yFinance (balance, financials, cashflow), lo convierte a DataFrame,
+    limpia y usa los timestamps como índice.
+    """
+    if raw_content is None:
+        # El archivo no existe. Simplemente devuelve un DataFrame vacío.
+        return pd.DataFrame()
+
+    data = orjson.loads(raw_content)
 
     # Cargar y transponer el DataFrame para que las fechas sean filas
     df = pd.DataFrame.from_dict(data, orient='index')
     
     # Convertir timestamps (milisegundos) a datetime
-    df.index = pd.to_datetime(df.index.astype(float) / 1000, unit='s')
+    df.index = pd.to_datetime(df.index.astype('int64'), unit='ms')
     df.index.name = 'Date'
     
     # Seleccionar solo las columnas necesarias y ordenar
-    df = df[keep_columns].sort_index(ascending=True)
+    df = df[keep_columns]
+    df.sort_index(ascending=True, inplace=True)
     
     return df
 
+def ensure_dir(path):
+    """Crea la carpeta si no existe, recordando las ya creadas para no repetir la llamada al sistema."""
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
+def write_parquet(output_path, df):
+    """Guarda un DataFrame como Parquet (Snappy) a través de un archivo con búfer. Devuelve la ruta escrita."""
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        df.to_parquet(f, engine='pyarrow', compression='snappy')
+    return output_path
+
+def format_ratios_for_display(df_ratios):
+    """
+    Da formato de texto a la tabla de ratios actuales para mostrarla por pantalla:
+    importes en miles de millones y ratios con dos decimales ('N/A' si son infinitos).
+    """
+    df_display = df_ratios[DISPLAY_COLS].copy()
+    df_display['Market Cap'] = (df_display['Market Cap'] / 1e9).round(2).apply(lambda x: f"{x:,.2f}B")
+    df_display['EV'] = (df_display['EV'] / 1e9).round(2).apply(lambda x: f"{x:,.2f}B")
+
+    ratios = df_display[NUM_COLS].to_numpy(dtype=float)
+    df_display[NUM_COLS] = np.where(ratios == np.inf, 'N/A', np.char.mod('%.2f', ratios))
+    return df_display
+
 def calculate_ratios(df_combined, info_data, ticker):
     """
     Calcula todos los ratios (históricos y de mercado) para el último período disponible.
-    Devuelve una Serie de Pandas con los resultados del último periodo y el DataFrame histórico.
+    Devuelve un diccionario con los resultados del último periodo y el DataFrame histórico.
     """
     if df_combined.empty:
         return None, None, None
@@ -58,9 +133,11 @@ def calculate_ratios(df_combined, info_data, ticker):
 
     # 2. ROIC (Retorno sobre el Capital Invertido)
     # Tasa Impositiva
-    tax_rate = df_combined.apply(
-        lambda row: row['Tax Provision'] / row['Pretax Income'] if row['Pretax Income'] != 0 else 0.21, 
-        axis=1
+    pretax_income = df_combined['Pretax Income'].to_numpy()
+    tax_rate = np.where(
+        pretax_income != 0,
+        df_combined['Tax Provision'].to_numpy() / np.where(pretax_income == 0, 1, pretax_income),
+        0.21
     )
     df_combined['ROIC (%)'] = (df_combined['EBIT'] * (1 - tax_rate) / df_combined['Invested Capital']) * 100
 
@@ -106,25 +183,27 @@ def calculate_ratios(df_combined, info_data, ticker):
     }
     
     # Retornamos el resumen actual, la tabla histórica y el industryKey
-    return pd.Series(results_current), df_combined.copy(), industry_key
+    return results_current, df_combined.copy(), industry_key
 
-def analyze_ticker(ticker):
+def analyze_ticker(ticker, raw_files=None):
     """
     Función principal para cargar, consolidar y analizar los datos de una única empresa (ticker).
-    Retorna (ratios_series, df_historical, industry_key)
+    'raw_files' puede traer el contenido ya leído de los archivos ({tipo: bytes}); si no, se leen aquí.
+    Retorna (ratios_dict, df_historical, industry_key)
     """
     print(f"\n--- Procesando {ticker} ---")
     
-    # 1. Definir rutas de archivo
-    financials_path = os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type='financials'))
-    balance_path = os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type='balance_sheet'))
-    cashflow_path = os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type='cashflow'))
-    info_path = os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type='info'))
+    # 1. Leer los archivos si no vienen precargados
+    if raw_files is None:
+        raw_files = {
+            file_type: read_raw_file(os.path.join(INPUT_DIR, FILE_PATTERN.format(ticker=ticker, type=file_type)))
+            for file_type in RAW_FILE_TYPES
+        }
 
     # 2. Cargar datos
-    df_financials = load_and_clean_financial_data(financials_path, FINANCIALS_COLS)
-    df_balance = load_and_clean_financial_data(balance_path, BALANCE_SHEET_COLS)
-    df_cashflow = load_and_clean_financial_data(cashflow_path, CASHFLOW_COLS)
+    df_financials = load_and_clean_financial_data(raw_files['financials'], FINANCIALS_COLS)
+    df_balance = load_and_clean_financial_data(raw_files['balance_sheet'], BALANCE_SHEET_COLS)
+    df_cashflow = load_and_clean_financial_data(raw_files['cashflow'], CASHFLOW_COLS)
 
     # Bloque para indicar qué DataFrame está vacío
     if df_financials.empty or df_balance.empty or df_cashflow.empty:
@@ -140,135 +219,142 @@ def analyze_ticker(ticker):
         # Retorna None para el resumen actual, None para el histórico y None para industryKey
         return None, None, None
 
-    info_data = {}
-    try:
-        with open(info_path, 'r') as f:
-            info_data = json.load(f)
-    except FileNotFoundError:
+    if raw_files['info'] is None:
         print(f"Advertencia: Archivo INFO no encontrado para {ticker}.")
         return None, None, None # Retorna None para todo si falta INFO
+    info_data = orjson.loads(raw_files['info'])
 
     # 3. Consolidar (Solo las filas completas son críticas para ratios)
-    df_combined = pd.concat([df_financials, df_balance, df_cashflow], axis=1).dropna(
-        subset=['Net Income', 'Stockholders Equity', 'EBIT', 'EBITDA', 'Free Cash Flow']
-    )
+    # Unión interna: solo interesan las fechas presentes en los tres estados financieros
+    df_combined = df_financials.join(df_balance, how='inner').join(df_cashflow, how='inner')
+    complete_rows = ~np.isnan(df_combined[REQUIRED_COLS].to_numpy(dtype=float)).any(axis=1)
+    df_combined = df_combined.iloc[complete_rows]
     
     if df_combined.empty:
         print(f"Advertencia: No hay períodos completos de datos para {ticker}.")
         return None, None, info_data.get('industryKey', None) # Retorna None, None y industryKey si existe
 
     # 4. Calcular y obtener ratios del último período
-    ratios_series, df_historical, industry_key = calculate_ratios(df_combined, info_data, ticker)
+    ratios_dict, df_historical, industry_key = calculate_ratios(df_combined, info_data, ticker)
     
-    if ratios_series is not None and isinstance(ratios_series, pd.Series):
-        ratios_series.name = ticker # Asignar el ticker como nombre de la Serie
-        return ratios_series, df_historical, industry_key
+    if ratios_dict is not None and 'Error' not in ratios_dict:
+        return ratios_dict, df_historical, industry_key
     else:
-        print(f"Error al calcular ratios de mercado para {ticker}: {ratios_series.get('Error', 'Error desconocido')}")
+        print(f"Error al calcular ratios de mercado para {ticker}: {ratios_dict.get('Error', 'Error desconocido')}")
         return None, df_historical, industry_key
 
 
 # --- 3. Bucle Principal para Múltiples Empresas ---
 
-all_ratios = []
-historical_dataframes = {} # Diccionario para almacenar los DataFrames históricos
-# Diccionario para mapear Ticker a IndustryKey y usarlo al guardar el CSV consolidado
-ticker_to_industry = {} 
+def main():
+    """Analiza todos los tickers de TICKERS_TO_ANALYZE y guarda los resultados por industria."""
+    all_ratios = [] # Lista de registros (ticker, diccionario de ratios)
+    historical_dataframes = {} # Diccionario para almacenar los DataFrames históricos
+    # Diccionario para mapear Ticker a IndustryKey y usarlo al guardar el archivo consolidado
+    ticker_to_industry = {} 
 
-for ticker in TICKERS_TO_ANALYZE:
-    # Capturamos el industry_key
-    result_current, df_historical, industry_key = analyze_ticker(ticker)
-    
-    if result_current is not None:
-        all_ratios.append(result_current)
-        # Guardamos el mapeo Ticker -> IndustryKey
-        ticker_to_industry[ticker] = industry_key
-    
-    if df_historical is not None:
-        # Almacenar el DataFrame histórico con el Ticker como clave
-        historical_dataframes[ticker] = df_historical
+    # Leer todos los archivos de una vez, en paralelo, antes del análisis
+    raw_files_by_ticker = prefetch_raw_files(TICKERS_TO_ANALYZE)
 
-# --- 4. Crear el DataFrame de Resultados Finales y Guardar ---
+    for ticker in TICKERS_TO_ANALYZE:
+        # Capturamos el industry_key
+        result_current, df_historical, industry_key = analyze_ticker(ticker, raw_files_by_ticker[ticker])
 
-# Preparar la carpeta de salida
-OUTPUT_BASE_DIR = 'data/processed'
-os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
-current_date = datetime.now().strftime('%Y-%m-%d')
+        if result_current is not None:
+            all_ratios.append((ticker, result_current))
+            # Guardamos el mapeo Ticker -> IndustryKey
+            ticker_to_industry[ticker] = industry_key
 
+        if df_historical is not None:
+            # Almacenar el DataFrame histórico con el Ticker como clave
+            historical_dataframes[ticker] = df_historical
 
-if all_ratios:
-    df_final_ratios = pd.DataFrame(all_ratios)
-    df_final_ratios.index.name = 'Ticker' # El índice es el nombre del Ticker
-    
-    # Extraer la IndustryKey del DataFrame consolidado antes de dar formato
-    # Se agruparán los resultados por la IndustryKey para guardarlos por separado.
-    
-    # 4.1. Guardar la tabla de ratios actuales (dividida por IndustryKey)
-    
-    # Usamos la columna IndustryKey para agrupar y guardar
-    unique_industries = df_final_ratios['IndustryKey'].unique()
-    
-    for industry in unique_industries:
-        df_industry = df_final_ratios[df_final_ratios['IndustryKey'] == industry].drop(columns=['IndustryKey'])
-        
-        # 1. Definir la ruta de salida (incluyendo la subcarpeta de la industria)
-        industry_output_dir = os.path.join(OUTPUT_BASE_DIR, industry)
-        os.makedirs(industry_output_dir, exist_ok=True)
-
-        # 2. Guardar el archivo CSV (versión sin formato)
-        file_name_current = f"current_ratios_consolidated_{current_date}.csv"
-        output_path_current = os.path.join(industry_output_dir, file_name_current)
-        df_industry.to_csv(output_path_current)
-        print(f"\nÉxito: Tabla de ratios actuales CONSOLIDADOS para '{industry}' guardada en: {output_path_current}")
-
-        # 3. Preparar para visualización
-        df_display_ratios = df_industry.copy()
-        df_display_ratios['Market Cap'] = (df_display_ratios['Market Cap'] / 1e9).round(2).apply(lambda x: f"{x:,.2f}B")
-        df_display_ratios['EV'] = (df_display_ratios['EV'] / 1e9).round(2).apply(lambda x: f"{x:,.2f}B")
-        
-        for col in ['ROE (%)', 'ROIC (%)', 'PER (Price/EPS)', 'EV/EBIT', 'EV/EBITDA', 'EV/FCF']:
-            df_display_ratios[col] = df_display_ratios[col].apply(lambda x: f"{x:.2f}" if x != float('inf') else 'N/A')
-        
-        output_cols_display = ['Date (Últ. Reporte)', 'ROE (%)', 'ROIC (%)', 'PER (Price/EPS)', 'EV/EBIT', 'EV/EBITDA', 'EV/FCF', 'Market Cap', 'EV']
-        df_display_ratios = df_display_ratios[output_cols_display]
-        
-        print(f"\n--- TABLA CONSOLIDADA PARA INDUSTRIA: {industry.upper()} ---")
-        print(df_display_ratios.to_string())
-    
-else:
-    print("\nNo se pudo calcular ningún ratio de resumen actual.")
+    # --- 4. Crear el DataFrame de Resultados Finales y Guardar ---
 
+    # Preparar la carpeta de salida
+    ensure_dir(OUTPUT_BASE_DIR)
+    current_date = datetime.now().strftime('%Y-%m-%d')
 
-# 5. Mostrar un ejemplo del DataFrame Histórico y Guardar Archivos Individuales
-if historical_dataframes:
-    print("\n\n#####################################################")
-    print("--- GUARDANDO DATOS HISTÓRICOS DETALLADOS ---")
-    print("#####################################################")
-    
-    # 5.1. Guardar cada DataFrame histórico individualmente en su carpeta de industria
-    for ticker, df_hist in historical_dataframes.items():
-        # Usar el mapeo Ticker a IndustryKey para determinar la ruta
-        industry = ticker_to_industry.get(ticker, 'default_industry')
-        
-        industry_output_dir = os.path.join(OUTPUT_BASE_DIR, industry)
-        os.makedirs(industry_output_dir, exist_ok=True) # Crear carpeta si no existe
 
-        file_name_historical = f"{ticker}_historical_analysis.csv"
-        output_path_historical = os.path.join(industry_output_dir, file_name_historical)
-        
-        df_hist.to_csv(output_path_historical)
-        print(f"Éxito: Histórico de {ticker} (Industria: {industry}) guardado en: {output_path_historical}")
+    if all_ratios:
+        # Construir el DataFrame de una sola vez a partir de los registros (ticker, ratios)
+        df_final_ratios = pd.DataFrame.from_records(
+            [ratios for _, ratios in all_ratios], index=[ticker for ticker, _ in all_ratios]
+        )
+        df_final_ratios.index.name = 'Ticker' # El índice es el nombre del Ticker
 
+        # Extraer la IndustryKey del DataFrame consolidado antes de dar formato
+        # Se agruparán los resultados por la IndustryKey para guardarlos por separado.
 
-    # 5.2. Mostrar un ejemplo del DataFrame Histórico (para demostración)
-    first_ticker = list(historical_dataframes.keys())[0]
-    df_hist = historical_dataframes[first_ticker]
-    
-    print(f"\nEjemplo de Datos Históricos de {first_ticker} (ROE y ROIC por año):")
-    # Mostramos solo las columnas clave para el histórico
-    print(df_hist[['Net Income', 'Stockholders Equity', 'EBIT', 'Invested Capital', 'ROE (%)', 'ROIC (%)']].tail())
-    
-    print("\nNota: Todos los DataFrames históricos completos están almacenados en la carpeta 'data/processed/{industry}'.")
-    
-else:
-    print("\nNo se generaron DataFrames históricos.")
+        # 4.1. Guardar la tabla de ratios actuales (dividida por IndustryKey)
+
+        # Usamos la columna IndustryKey para agrupar y guardar (una sola pasada sobre el DataFrame)
+        industry_groups = {
+            industry: df_group.drop(columns=['IndustryKey'])
+            for industry, df_group in df_final_ratios.groupby('IndustryKey', sort=False)
+        }
+
+        # 1. Definir las rutas de salida (incluyendo la subcarpeta de la industria) y crear las carpetas
+        file_name_current = f"current_ratios_consolidated_{current_date}.parquet"
+        output_paths_current = {}
+        for industry in industry_groups:
+            industry_output_dir = os.path.join(OUTPUT_BASE_DIR, industry)
+            ensure_dir(industry_output_dir)
+            output_paths_current[industry] = os.path.join(industry_output_dir, file_name_current)
+
+        # 2. Guardar los archivos Parquet (versión sin formato) en paralelo
+        with ThreadPoolExecutor(max_workers=FILE_WRITERS) as executor:
+            list(executor.map(write_parquet, output_paths_current.values(), industry_groups.values()))
+
+        # 3. Preparar para visualización (una sola vez para todas las industrias)
+        df_display_full = format_ratios_for_display(df_final_ratios)
+
+        for industry, df_industry in industry_groups.items():
+            print(f"\nÉxito: Tabla de ratios actuales CONSOLIDADOS para '{industry}' guardada en: {output_paths_current[industry]}")
+
+            df_display_ratios = df_display_full.loc[df_industry.index]
+
+            print(f"\n--- TABLA CONSOLIDADA PARA INDUSTRIA: {industry.upper()} ---")
+            print(df_display_ratios.to_string())
+
+    else:
+        print("\nNo se pudo calcular ningún ratio de resumen actual.")
+
+
+    # 5. Mostrar un ejemplo del DataFrame Histórico y Guardar Archivos Individuales
+    if historical_dataframes:
+        print("\n\n#####################################################")
+        print("--- GUARDANDO DATOS HISTÓRICOS DETALLADOS ---")
+        print("#####################################################")
+
+        # 5.1. Guardar cada DataFrame histórico individualmente en su carpeta de industria
+        for ticker, df_hist in historical_dataframes.items():
+            # Usar el mapeo Ticker a IndustryKey para determinar la ruta
+            industry = ticker_to_industry.get(ticker, 'default_industry')
+
+            industry_output_dir = os.path.join(OUTPUT_BASE_DIR, industry)
+            ensure_dir(industry_output_dir) # Crear carpeta si no existe
+
+            file_name_historical = f"{ticker}_historical_analysis.parquet"
+            output_path_historical = os.path.join(industry_output_dir, file_name_historical)
+
+            write_parquet(output_path_historical, df_hist)
+            print(f"Éxito: Histórico de {ticker} (Industria: {industry}) guardado en: {output_path_historical}")
+
+
+        # 5.2. Mostrar un ejemplo del DataFrame Histórico (para demostración)
+        first_ticker = list(historical_dataframes.keys())[0]
+        df_hist = historical_dataframes[first_ticker]
+
+        print(f"\nEjemplo de Datos Históricos de {first_ticker} (ROE y ROIC por año):")
+        # Mostramos solo las columnas clave para el histórico
+        print(df_hist[['Net Income', 'Stockholders Equity', 'EBIT', 'Invested Capital', 'ROE (%)', 'ROIC (%)']].tail())
+
+        print("\nNota: Todos los DataFrames históricos completos están almacenados en la carpeta 'data/processed/{industry}'.")
+
+    else:
+        print("\nNo se generaron DataFrames históricos.")
+
+
+if __name__ == '__main__':
+    main()